@@ -0,0 +1,34 @@
+import hashlib
+from typing import Any, Sequence
+
+from fastapi import Response
+
+
+def compute_etag(records: Any | Sequence[Any]) -> str:
+    # a strong validator built from the row values themselves, so that it can be
+    # checked before anything gets serialized
+    if not isinstance(records, (list, tuple)):
+        records = [records]
+
+    digest = hashlib.blake2b(digest_size=16)
+    for record in records:
+        values = tuple(getattr(record, column.key) for column in record.__table__.columns)
+        digest.update(repr(values).encode())
+
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(etag: str, if_none_match: str | None) -> bool:
+    if not if_none_match:
+        return False
+
+    if if_none_match.strip() == "*":
+        return True
+
+    # If-None-Match uses the weak comparison, so a W/ prefix doesn't matter
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+def not_modified(response: Response) -> Response:
+    headers = {name: value for name, value in response.headers.items() if name != "content-length"}
+    return Response(status_code=304, headers=headers)
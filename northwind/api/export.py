@@ -0,0 +1,40 @@
+import csv
+import io
+from typing import Any, AsyncIterator, Sequence
+
+import orjson
+from pydantic.json import pydantic_encoder
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+async def ndjson_lines(chunks: AsyncIterator[Sequence[dict[str, Any]]]) -> AsyncIterator[bytes]:
+    async for chunk in chunks:
+        yield b"".join(orjson.dumps(dict(row), default=pydantic_encoder) + b"\n" for row in chunk)
+
+
+def _csv_value(value: Any) -> Any:
+    # the way postgres itself writes bytea to csv
+    if isinstance(value, (bytes, memoryview)):
+        return "\\x" + bytes(value).hex()
+    return value
+
+
+async def csv_lines(columns: Sequence[str], chunks: AsyncIterator[Sequence[dict[str, Any]]]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(columns)
+    async for chunk in chunks:
+        writer.writerows([_csv_value(row[column]) for column in columns] for row in chunk)
+        yield buffer.getvalue().encode()
+
+        buffer.seek(0)
+        buffer.truncate()
+
+    # the header still has to go out for an empty table
+    if buffer.tell():
+        yield buffer.getvalue().encode()
@@ -1,5 +1,15 @@
-from fastapi import APIRouter, Body, Depends, Path, Query
+from typing import Literal
 
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Path, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import NoResultFound
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from northwind.api.etag import compute_etag, etag_matches, not_modified
+from northwind.api.export import MEDIA_TYPES, csv_lines, ndjson_lines
+from northwind.api.responses import render
+from northwind.config import Settings, get_settings
+from northwind.database import get_request_session, next_cursor
 from northwind.models.region import RegionService
 from northwind.schemas.region import Region, RegionDB
 
@@ -8,30 +18,99 @@ router = APIRouter(
 )
 
 
+def region_service(session: AsyncSession = Depends(get_request_session)) -> RegionService:
+    return RegionService(session=session)
+
+
 @router.post("/", status_code=201)
-async def create_region(body: Region = Body(), service: RegionService = Depends()) -> RegionDB:
+async def create_region(body: Region = Body(), service: RegionService = Depends(region_service)) -> RegionDB:
     return await service.create(body.dict())
 
 
+@router.post("/batch/", status_code=201)
+async def create_regions(
+    body: list[Region] = Body(), service: RegionService = Depends(region_service)
+) -> list[RegionDB]:
+    return await service.create_many([region.dict() for region in body])
+
+
 @router.get("/")
 async def retrieve_list_of_regions(
+    response: Response,
     offset: int | None = Query(default=None, ge=0),
     limit: int | None = Query(default=None, ge=0),
-    service: RegionService = Depends(),
+    cursor: str | None = Query(default=None),
+    if_none_match: str | None = Header(default=None),
+    settings: Settings = Depends(get_settings),
+    service: RegionService = Depends(region_service),
 ) -> list[RegionDB]:
-    return await service.retrieve(offset=offset, limit=limit)
+    if offset and cursor is not None:
+        raise HTTPException(status_code=422, detail="'offset' and 'cursor' can't be used together")
+
+    try:
+        regions = await service.retrieve(offset=offset, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    # a full page means there may be more rows, so hand out a token to seek past the last one
+    if limit and len(regions) == limit:
+        response.headers["X-Next-Cursor"] = next_cursor(service.model, regions)
+
+    response.headers["ETag"] = etag = compute_etag(regions)
+    if etag_matches(etag, if_none_match):
+        return not_modified(response)
+
+    return render(regions, RegionDB, response, trusted=settings.trusted_serialization)
+
+
+@router.get("/export/")
+async def export_regions(
+    format: Literal["ndjson", "csv"] = Query(default="ndjson"),
+    chunk_size: int | None = Query(default=None, gt=0),
+    settings: Settings = Depends(get_settings),
+) -> StreamingResponse:
+    # the stream opens its own session, since it outlives the request handler
+    service = RegionService()
+    chunks = service.stream(chunk_size=chunk_size if chunk_size else settings.export_chunk_size)
+    if format == "csv":
+        lines = csv_lines([column.name for column in service.model.__table__.columns], chunks)
+    else:
+        lines = ndjson_lines(chunks)
+
+    return StreamingResponse(
+        lines,
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="regions.{format}"'},
+    )
 
 
 @router.get("/{id}/")
-async def retrieve_region_details(id: int = Path(gt=0), service: RegionService = Depends()) -> RegionDB:
-    return await service.retrieve(id)
+async def retrieve_region_details(
+    response: Response,
+    id: int = Path(gt=0),
+    if_none_match: str | None = Header(default=None),
+    settings: Settings = Depends(get_settings),
+    service: RegionService = Depends(region_service),
+) -> RegionDB:
+    region = await service.retrieve(id)
+
+    response.headers["ETag"] = etag = compute_etag(region)
+    if etag_matches(etag, if_none_match):
+        return not_modified(response)
+
+    return render(region, RegionDB, response, trusted=settings.trusted_serialization)
 
 
 @router.put("/{id}/")
-async def update_region(id: int = Path(gt=0), body: Region = Body(), service: RegionService = Depends()) -> RegionDB:
+async def update_region(
+    id: int = Path(gt=0), body: Region = Body(), service: RegionService = Depends(region_service)
+) -> RegionDB:
     return await service.update(id, body.dict(exclude_unset=True))
 
 
 @router.delete("/{id}/")
-async def delete_region(id: int = Path(gt=0), service: RegionService = Depends()) -> RegionDB:
-    return await service.delete(id)
+async def delete_region(id: int = Path(gt=0), service: RegionService = Depends(region_service)) -> RegionDB:
+    try:
+        return await service.delete(id)
+    except NoResultFound:
+        raise HTTPException(status_code=404, detail="Region not found")
@@ -0,0 +1,38 @@
+from typing import Any, Sequence, Type
+
+import orjson
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from pydantic.json import pydantic_encoder
+
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        # types orjson doesn't know are encoded the way pydantic would encode them
+        return orjson.dumps(content, default=pydantic_encoder, option=orjson.OPT_NON_STR_KEYS)
+
+
+def to_dict(record: Any, schema: Type[BaseModel]) -> dict[str, Any]:
+    return {name: getattr(record, name) for name in schema.__fields__}
+
+
+def render(
+    content: Any | Sequence[Any],
+    schema: Type[BaseModel],
+    response: Response,
+    trusted: bool = True,
+    status_code: int = 200,
+) -> Any:
+    # rows read from our own database don't need to be validated again, so the trusted path
+    # builds plain dicts from them and skips the response model altogether
+    if not trusted:
+        return content
+
+    if isinstance(content, (list, tuple)):
+        content = [to_dict(record, schema) for record in content]
+    else:
+        content = to_dict(content, schema)
+
+    headers = {name: value for name, value in response.headers.items() if name != "content-length"}
+    return ORJSONResponse(content, status_code=status_code, headers=headers)
@@ -0,0 +1,97 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable
+
+MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None):
+        if maxsize < 1:
+            raise ValueError("'maxsize' must be greater than 0")
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        item = self._data.get(key)
+        if item is not None:
+            expires_at, value = item
+            if expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+
+            del self._data[key]
+
+        self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def evict(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def evict_where(self, predicate: Callable[[Hashable], bool]):
+        for key in [key for key in self._data if predicate(key)]:
+            del self._data[key]
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict[str, Any]:
+        requests = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / requests if requests else 0.0,
+        }
+
+
+# caches of the models that opted in, by table name
+caches: dict[str, LRUCache] = {}
+
+
+def register_cache(model, cache: LRUCache):
+    caches[model.__tablename__] = cache
+
+
+def get_cache(model) -> LRUCache | None:
+    return caches.get(model.__tablename__)
+
+
+def invalidate(model, ids: Iterable[Any] | None = None):
+    invalidate_table(model.__tablename__, ids)
+
+
+def invalidate_table(table: str, ids: Iterable[Any] | None = None):
+    cache = caches.get(table)
+    if cache is None:
+        return
+
+    # any write may change any page, so pages are always dropped
+    if ids is None:
+        cache.clear()
+    else:
+        for id in ids:
+            cache.evict(("id", id))
+        cache.evict_where(lambda key: key[0] != "id")
+
+
+def clear_caches():
+    for cache in caches.values():
+        cache.clear()
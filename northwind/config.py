@@ -0,0 +1,89 @@
+from functools import lru_cache
+from typing import Literal
+
+from pydantic import BaseSettings
+
+from northwind.utils import get_database_url
+
+
+class Settings(BaseSettings):
+    postgres_user: str = "postgres"
+    postgres_password: str = "postgres"
+    postgres_host: str = "localhost"
+    postgres_port: int = 5432
+    postgres_db: str = "northwind"
+
+    # connection pool, per worker process
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: float = 30.0
+    pool_recycle: int = -1  # seconds, -1 disables recycling
+    pool_pre_ping: bool = False
+
+    # asyncpg
+    statement_cache_size: int = 100  # asyncpg's own cache of prepared statements
+    prepared_statement_cache_size: int = 100  # sqlalchemy's cache on top of the asyncpg connection
+    statement_timeout: int | None = None  # milliseconds, applied on the server side
+
+    # read replicas as "host" or "host:port", sharing the credentials and database name of the primary
+    postgres_replicas: list[str] = []
+    replica_policy: Literal["round_robin", "least_in_flight"] = "round_robin"
+    read_your_writes_window: float = 5.0  # seconds a session keeps reading from the primary after a write
+
+    # build responses straight from the rows instead of validating them through the response models
+    trusted_serialization: bool = True
+
+    # rows fetched per round trip by the export endpoints
+    export_chunk_size: int = 1000
+
+    # LISTEN/NOTIFY channel cache invalidations are exchanged on between workers, None disables it
+    cache_invalidation_channel: str | None = "northwind_cache"
+
+    class Config:
+        env_file = ".env"
+
+    @property
+    def database_url(self) -> str:
+        return get_database_url(
+            self.postgres_user,
+            self.postgres_password,
+            self.postgres_host,
+            self.postgres_port,
+            self.postgres_db,
+            dialect="postgresql+asyncpg",
+        )
+
+    @property
+    def dsn(self) -> str:
+        # for plain asyncpg connections
+        return get_database_url(
+            self.postgres_user,
+            self.postgres_password,
+            self.postgres_host,
+            self.postgres_port,
+            self.postgres_db,
+            dialect="postgresql",
+        )
+
+    @property
+    def replica_urls(self) -> list[str]:
+        urls = []
+        for replica in self.postgres_replicas:
+            host, _, port = replica.partition(":")
+            urls.append(
+                get_database_url(
+                    self.postgres_user,
+                    self.postgres_password,
+                    host,
+                    port if port else self.postgres_port,
+                    self.postgres_db,
+                    dialect="postgresql+asyncpg",
+                )
+            )
+
+        return urls
+
+
+@lru_cache
+def get_settings() -> Settings:
+    return Settings()
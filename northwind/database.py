@@ -1,39 +1,157 @@
-import os
+import base64
+import datetime
+import itertools
+import json
+import time
 from contextlib import asynccontextmanager
-from typing import Any, AsyncIterator, Type, TypeVar
+from typing import Any, AsyncIterator, Sequence, Type, TypeVar
 
 import sqlalchemy as sa
 from sqlalchemy import MetaData
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm.session import sessionmaker
+from sqlalchemy.orm.session import Session, sessionmaker
+
+from northwind import invalidation
+from northwind.cache import MISSING, LRUCache, get_cache, invalidate, register_cache
+from northwind.config import Settings, get_settings
+from northwind.utils import get_database_url  # noqa: F401
 
 T = TypeVar("T")
 
-# FIXME: move database params to config
-POSTGRES_USER = e if (e := os.getenv("POSTGRES_USER")) else "postgres"
-POSTGRES_PASSWORD = e if (e := os.getenv("POSTGRES_PASSWORD")) else "postgres"
-POSTGRES_HOST = e if (e := os.getenv("POSTGRES_HOST")) else "localhost"
-POSTGRES_PORT = e if (e := os.getenv("POSTGRES_PORT")) else 5432
-POSTGRES_DB = e if (e := os.getenv("POSTGRES_DB")) else "northwind"
+# postgres refuses statements with more bind parameters than this
+MAX_QUERY_PARAMETERS = 32767
+# batches of this size and larger are loaded with COPY instead of INSERT
+COPY_THRESHOLD = 5000
+
+
+def create_engine(settings: Settings, url: str | None = None) -> AsyncEngine:
+    connect_args = {
+        "statement_cache_size": settings.statement_cache_size,
+        "prepared_statement_cache_size": settings.prepared_statement_cache_size,
+    }
+    if settings.statement_timeout is not None:
+        connect_args["server_settings"] = {"statement_timeout": str(settings.statement_timeout)}
+
+    return create_async_engine(
+        url if url else settings.database_url,
+        echo=False,
+        pool_size=settings.pool_size,
+        max_overflow=settings.max_overflow,
+        pool_timeout=settings.pool_timeout,
+        pool_recycle=settings.pool_recycle,
+        pool_pre_ping=settings.pool_pre_ping,
+        connect_args=connect_args,
+    )
+
+
+class EngineRouter:
+    def __init__(
+        self,
+        primary: AsyncEngine,
+        replicas: Sequence[AsyncEngine] = (),
+        policy: str = "round_robin",
+        read_your_writes_window: float = 0.0,
+    ):
+        if policy not in ("round_robin", "least_in_flight"):
+            raise ValueError(f"unknown replica policy '{policy}'")
+
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.policy = policy
+        self.read_your_writes_window = read_your_writes_window
+        self._next = itertools.cycle(self.replicas)
+
+    def reader(self) -> AsyncEngine:
+        if not self.replicas:
+            return self.primary
+
+        if self.policy == "least_in_flight":
+            return min(self.replicas, key=lambda engine: engine.sync_engine.pool.checkedout())
+
+        return next(self._next)
+
+    async def dispose(self):
+        for engine in [self.primary, *self.replicas]:
+            await engine.dispose()
+
+
+def _is_write(clause: sa.sql.ClauseElement | None) -> bool:
+    # ORM statements built with from_statement() wrap the actual DML
+    clause = getattr(clause, "element", clause)
+
+    if clause is None or isinstance(clause, sa.sql.expression.UpdateBase):
+        return True
+
+    return getattr(clause, "_for_update_arg", None) is not None
+
+
+class RoutingSession(Session):
+    # reads go to a replica and writes to the primary; after a write the session keeps reading
+    # from the primary for a while, so that it sees its own writes despite replication lag
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        router = get_router()
+        if not router.replicas:
+            return router.primary.sync_engine
+
+        now = time.monotonic()
+        if self._flushing or _is_write(clause):
+            self.info["primary_until"] = now + router.read_your_writes_window
+            return router.primary.sync_engine
+
+        if now < self.info.get("primary_until", 0.0):
+            return router.primary.sync_engine
+
+        return router.reader().sync_engine
+
+
+_router: EngineRouter | None = None
+_sessionmaker: sessionmaker | None = None
+
+
+def init_engine(settings: Settings | None = None) -> AsyncEngine:
+    global _router, _sessionmaker
+
+    settings = settings if settings else get_settings()
+    _router = EngineRouter(
+        create_engine(settings),
+        [create_engine(settings, url) for url in settings.replica_urls],
+        policy=settings.replica_policy,
+        read_your_writes_window=settings.read_your_writes_window,
+    )
+    _sessionmaker = sessionmaker(
+        _router.primary, expire_on_commit=False, class_=AsyncSession, sync_session_class=RoutingSession
+    )
+
+    return _router.primary
+
+
+async def dispose_engine():
+    global _router, _sessionmaker
+
+    if _router is not None:
+        await _router.dispose()
+
+    _router = None
+    _sessionmaker = None
+
 
+def get_router() -> EngineRouter:
+    # created lazily, so that every worker process sizes its own pools
+    if _router is None:
+        init_engine()
 
-def get_database_url(user: str, password: str, host: str, port: str, dbname: str, dialect: str = "postgres") -> str:
-    return f"{dialect}://{user}:{password}@{host}:{port}/{dbname}"
+    return _router
 
 
-database_uri = get_database_url(
-    POSTGRES_USER,
-    POSTGRES_PASSWORD,
-    POSTGRES_HOST,
-    POSTGRES_PORT,
-    POSTGRES_DB,
-    dialect="postgresql+asyncpg",
-)
+def get_engine() -> AsyncEngine:
+    return get_router().primary
 
-engine = create_async_engine(database_uri, echo=False)
 
-AsyncSessionLocal = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+def get_sessionmaker() -> sessionmaker:
+    get_router()
+    return _sessionmaker
+
 
 convention = {
     "ix": "ix_%(column_0_label)s",
@@ -49,7 +167,10 @@ Base = declarative_base(metadata=metadata)
 
 
 @asynccontextmanager
-async def get_session(asyncsessionmaker=AsyncSessionLocal) -> AsyncIterator[AsyncSession]:
+async def get_session(asyncsessionmaker: sessionmaker | None = None) -> AsyncIterator[AsyncSession]:
+    if asyncsessionmaker is None:
+        asyncsessionmaker = get_sessionmaker()
+
     try:
         async with asyncsessionmaker() as session:
             yield session
@@ -61,6 +182,58 @@ async def get_session(asyncsessionmaker=AsyncSessionLocal) -> AsyncIterator[Asyn
         await session.close()
 
 
+@asynccontextmanager
+async def transaction(session: AsyncSession | None = None) -> AsyncIterator[AsyncSession]:
+    # a session handed in by the caller already runs in the caller's transaction
+    if session is not None:
+        yield session
+        return
+
+    async with get_session() as session:
+        async with session.begin():
+            yield session
+
+
+async def get_request_session() -> AsyncIterator[AsyncSession]:
+    # FastAPI dependency: one session and one transaction per request,
+    # committed when the request is done or rolled back if it failed
+    async with get_session() as session:
+        async with session.begin():
+            yield session
+
+
+def _written_tables(session: AsyncSession) -> set[str]:
+    return {model.__tablename__ for model, _ in session.sync_session.info.get("invalidations", ())}
+
+
+async def _invalidate_cache(session: AsyncSession, model: Base, ids: Sequence[Any] | None = None):
+    if get_cache(model) is None:
+        return
+
+    # dropped right away for this worker, and once more after commit, since a concurrent
+    # reader may have cached the old row again while the transaction was still open
+    invalidate(model, ids)
+    session.sync_session.info.setdefault("invalidations", []).append((model, ids))
+
+    # other workers learn about it on commit; a rolled back transaction notifies nobody
+    if invalidation.channel is not None:
+        connection = await session.connection()
+        await connection.execute(
+            sa.select(sa.func.pg_notify(invalidation.channel, invalidation.encode_event(model.__tablename__, ids)))
+        )
+
+
+@sa.event.listens_for(Session, "after_commit")
+def _invalidate_cache_after_commit(session: Session):
+    for model, ids in session.info.pop("invalidations", ()):
+        invalidate(model, ids)
+
+
+@sa.event.listens_for(Session, "after_soft_rollback")
+def _forget_invalidations_after_rollback(session: Session, previous_transaction):
+    session.info.pop("invalidations", None)
+
+
 def primary_key(model: Base):
     pk: sa.Column
     for pk in model.__table__.primary_key:
@@ -75,6 +248,83 @@ def _pk_equals_id(model: Base, id: Any):
     return sa.or_(*whereclauses)
 
 
+def _pk_in_ids(model: Base, ids: Sequence[Any]):
+    pks = list(primary_key(model))
+    if len(pks) == 1:
+        return pks[0].in_(ids)
+
+    return sa.tuple_(*pks).in_(ids)
+
+
+def _sort_columns(model: Base, order_by: str | None = None) -> tuple[list[sa.Column], bool]:
+    # the primary key is appended to the sort key to break ties
+    pks = list(primary_key(model))
+    if not order_by:
+        return pks, False
+
+    descending = order_by.startswith("-")
+    name = order_by.lstrip("-")
+    if name not in model.__table__.columns:
+        raise ValueError(f"unknown sort key '{name}'")
+
+    column = model.__table__.columns[name]
+    return [column] + [pk for pk in pks if pk is not column], descending
+
+
+def _coerce(column: sa.Column, value: Any) -> Any:
+    python_type = column.type.python_type
+    if value is None or isinstance(value, python_type):
+        return value
+    if python_type in (datetime.date, datetime.datetime, datetime.time):
+        return python_type.fromisoformat(value)
+    return python_type(value)
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(values), default=str).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError("malformed cursor")
+
+    if not isinstance(values, list):
+        raise ValueError("malformed cursor")
+
+    return values
+
+
+def next_cursor(model: Base, records: Sequence[Any], order_by: str | None = None) -> str | None:
+    if not records:
+        return None
+
+    columns, _ = _sort_columns(model, order_by)
+    last = records[-1]
+    return encode_cursor([getattr(last, column.key) for column in columns])
+
+
+def _seek(model: Base, stmt: sa.sql.Select, cursor: str | None = None, order_by: str | None = None):
+    columns, descending = _sort_columns(model, order_by)
+
+    if cursor is not None:
+        values = decode_cursor(cursor)
+        if len(values) != len(columns):
+            raise ValueError("cursor does not match the sort key")
+
+        try:
+            values = [_coerce(column, value) for column, value in zip(columns, values)]
+        except (TypeError, ValueError):
+            raise ValueError("malformed cursor")
+
+        # row value comparison lets postgres seek straight to the position through the index
+        key, position = sa.tuple_(*columns), sa.tuple_(*values)
+        stmt = stmt.where(key < position if descending else key > position)
+
+    return stmt.order_by(*(column.desc() if descending else column.asc() for column in columns))
+
+
 async def place_records_into_session_and_commit(records: list, session: AsyncSession):
     async with session:
         async with session.begin():
@@ -82,18 +332,88 @@ async def place_records_into_session_and_commit(records: list, session: AsyncSes
             # commit
 
 
+async def _insert_records(session: AsyncSession, model: Type[T], payloads: Sequence[dict[str, Any]]) -> list[T]:
+    records = []
+
+    # multi-row INSERT ... RETURNING, chunked to stay under the bind parameter limit
+    chunk_size = max(1, MAX_QUERY_PARAMETERS // max(1, len(payloads[0])))
+    for i in range(0, len(payloads), chunk_size):
+        stmt = sa.insert(model).values(payloads[i : i + chunk_size]).returning(*model.__table__.columns)
+        stmt = sa.select(model).from_statement(stmt).execution_options(populate_existing=True)
+        records += (await session.execute(stmt)).scalars().all()
+
+    return records
+
+
+def _serial_column(model: Base) -> sa.Column | None:
+    pks = list(primary_key(model))
+    if len(pks) != 1:
+        return None
+
+    column = pks[0]
+    if column.autoincrement in (True, "auto") and isinstance(column.type, sa.Integer) and column.default is None:
+        return column
+
+    return None
+
+
+async def _copy_records(session: AsyncSession, model: Type[T], payloads: Sequence[dict[str, Any]]) -> list[T]:
+    table: sa.Table = model.__table__
+    connection = await session.connection()
+
+    rows = [dict(payload) for payload in payloads]
+    keys = set(rows[0])
+
+    # COPY doesn't apply client-side defaults and can't return generated keys,
+    # so scalar defaults are filled in here and serial values are allocated up front
+    for column in table.columns:
+        if column.key not in keys and column.default is not None and column.default.is_scalar:
+            for row in rows:
+                row[column.key] = column.default.arg
+
+    column = _serial_column(model)
+    if column is not None and column.key not in keys:
+        sequence = sa.func.pg_get_serial_sequence(table.name, column.name)
+        stmt = sa.select(sa.func.nextval(sequence)).select_from(sa.func.generate_series(1, len(rows)))
+        for row, value in zip(rows, (await connection.execute(stmt)).scalars()):
+            row[column.key] = value
+
+    columns = [column for column in table.columns if column.key in rows[0]]
+    driver_connection = (await connection.get_raw_connection()).driver_connection
+    await driver_connection.copy_records_to_table(
+        table.name,
+        schema_name=table.schema,
+        columns=[column.name for column in columns],
+        records=[tuple(row[column.key] for column in columns) for row in rows],
+    )
+
+    return [model(**row) for row in rows]
+
+
 class CreateMixin:
     @staticmethod
-    async def create(model: Type[T], payload: dict[str, Any]) -> T:
-        record = model(**payload)
+    async def create(model: Type[T], payload: dict[str, Any], session: AsyncSession | None = None) -> T:
+        async with transaction(session) as session:
+            (record,) = await _insert_records(session, model, [payload])
+            await _invalidate_cache(session, model, ())
 
-        async with get_session() as session:
-            async with session.begin():
-                session.add(record)
+        return record
 
-            await session.refresh(record)
+    @staticmethod
+    async def create_many(
+        model: Type[T], payloads: Sequence[dict[str, Any]], session: AsyncSession | None = None
+    ) -> list[T]:
+        if not payloads:
+            return []
 
-        return record
+        async with transaction(session) as session:
+            if len(payloads) >= COPY_THRESHOLD:
+                records = await _copy_records(session, model, payloads)
+            else:
+                records = await _insert_records(session, model, payloads)
+            await _invalidate_cache(session, model, ())
+
+        return records
 
 
 class RetrieveMixin:
@@ -103,79 +423,142 @@ class RetrieveMixin:
         id: Any | None = None,
         offset: int | None = None,
         limit: int | None = None,
+        cursor: str | None = None,
+        order_by: str | None = None,
+        session: AsyncSession | None = None,
     ) -> list[T]:
-        async with get_session() as session:
-            async with session.begin():
-                stmt = sa.select(model)
+        cache = get_cache(model)
+        key = ("id", id) if id else ("list", offset, limit, cursor, order_by)
+
+        if cache is not None and (cached := cache.get(key)) is not MISSING:
+            return cached
+
+        async with transaction(session) as session:
+            # rows written by this very transaction must neither be served from nor put into the cache
+            if model.__tablename__ in _written_tables(session):
+                cache = None
+
+            stmt = sa.select(model)
 
-                if id:
-                    stmt = stmt.where(_pk_equals_id(model, id))
-                    result = (await session.execute(stmt)).scalars().one()
-                else:
-                    if offset:
-                        stmt = stmt.offset(offset)
-                    if limit:
-                        stmt = stmt.limit(limit)
-                    result = (await session.execute(stmt)).scalars().all()
+            if id:
+                stmt = stmt.where(_pk_equals_id(model, id))
+                result = (await session.execute(stmt)).scalars().one()
+            else:
+                # pages have to be ordered by a stable key, otherwise neither offset nor cursor is reliable
+                if limit or cursor is not None or order_by:
+                    stmt = _seek(model, stmt, cursor=cursor, order_by=order_by)
+                if offset:
+                    stmt = stmt.offset(offset)
+                if limit:
+                    stmt = stmt.limit(limit)
+                result = (await session.execute(stmt)).scalars().all()
 
-            return result
+        if cache is not None:
+            cache.set(key, result)
+
+        return result
+
+    @staticmethod
+    async def stream(
+        model: Type[T], chunk_size: int = 1000, session: AsyncSession | None = None
+    ) -> AsyncIterator[list[sa.engine.RowMapping]]:
+        # plain column rows from a server-side cursor, fetched chunk by chunk,
+        # so that memory stays flat however big the table is
+        stmt = sa.select(*model.__table__.columns).order_by(*primary_key(model))
+
+        async with transaction(session) as session:
+            result = await session.stream(stmt.execution_options(yield_per=chunk_size))
+            async for chunk in result.mappings().partitions(chunk_size):
+                yield chunk
 
 
 class UpdateMixin:
     @staticmethod
-    async def update(model: Type[T], id: Any, payload: dict[str, Any]) -> T:
-        async with get_session() as session:
-            async with session.begin():
-                # look up
-                stmt = sa.select(model).where(_pk_equals_id(model, id))
-                record = (await session.execute(stmt)).scalars().one()
-
-                # update
-                stmt = (
-                    sa.update(model)
-                    .where(_pk_equals_id(model, id))
-                    .values(payload)
-                    .execution_options(synchronize_session="fetch")
-                )
-
-                await session.execute(stmt)
-            await session.refresh(record)
+    async def update(model: Type[T], id: Any, payload: dict[str, Any], session: AsyncSession | None = None) -> T:
+        async with transaction(session) as session:
+            # a single UPDATE ... RETURNING instead of look up + update + refresh
+            stmt = sa.update(model).where(_pk_equals_id(model, id)).values(payload).returning(*model.__table__.columns)
+            stmt = sa.select(model).from_statement(stmt).execution_options(populate_existing=True)
+
+            record = (await session.execute(stmt)).scalars().one()
+            await _invalidate_cache(session, model, (id,))
 
         return record
 
 
 class DeleteMixin:
     @staticmethod
-    async def delete(model: Type[T], id: Any) -> T:
-        async with get_session() as session:
-            async with session.begin():
-                # look up
-                stmt = sa.select(model).where(_pk_equals_id(model, id))
-                record = (await session.execute(stmt)).scalars().one()
+    async def delete(model: Type[T], id: Any, session: AsyncSession | None = None) -> T:
+        async with transaction(session) as session:
+            stmt = sa.delete(model).where(_pk_equals_id(model, id)).returning(*model.__table__.columns)
+            stmt = sa.select(model).from_statement(stmt).execution_options(populate_existing=True)
+
+            record = (await session.execute(stmt)).scalars().one()
+            await _invalidate_cache(session, model, (id,))
+
+        return record
+
+    @staticmethod
+    async def delete_many(model: Type[T], ids: Sequence[Any], session: AsyncSession | None = None) -> list[T]:
+        if not ids:
+            return []
+
+        async with transaction(session) as session:
+            stmt = sa.delete(model).where(_pk_in_ids(model, ids)).returning(*model.__table__.columns)
+            stmt = sa.select(model).from_statement(stmt).execution_options(populate_existing=True)
 
-                # delete
-                stmt = sa.delete(model).where(_pk_equals_id(model, id)).execution_options(synchronize_session="fetch")
-                await session.execute(stmt)
+            records = (await session.execute(stmt)).scalars().all()
+            await _invalidate_cache(session, model, ids)
 
-            return record
+        return records
 
 
 class CRUDService(CreateMixin, RetrieveMixin, UpdateMixin, DeleteMixin):
     default_model = None  # TODO: think about another idea. i don't like it
 
-    def __init__(self, model: Type[T] | None = None):
+    # reads of the default model are cached in process when a subclass sets a ttl (in seconds)
+    cache_ttl: float | None = None
+    cache_maxsize: int = 1024
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.default_model is not None and cls.cache_ttl is not None:
+            register_cache(cls.default_model, LRUCache(maxsize=cls.cache_maxsize, ttl=cls.cache_ttl))
+
+    def __init__(self, model: Type[T] | None = None, session: AsyncSession | None = None):
         self.model = model if model else self.default_model
         if not self.model:
             raise RuntimeError("'model' should be provided")
 
+        # calls share this session (and its transaction) if it is given, otherwise each call opens its own
+        self.session = session
+
     async def create(self, payload: dict[str, Any]) -> T:
-        return await CreateMixin.create(self.model, payload)
+        return await CreateMixin.create(self.model, payload, session=self.session)
 
-    async def retrieve(self, id: Any | None = None, offset: int | None = None, limit: int | None = None) -> list[T]:
-        return await RetrieveMixin.retrieve(self.model, id=id, offset=offset, limit=limit)
+    async def create_many(self, payloads: Sequence[dict[str, Any]]) -> list[T]:
+        return await CreateMixin.create_many(self.model, payloads, session=self.session)
+
+    async def retrieve(
+        self,
+        id: Any | None = None,
+        offset: int | None = None,
+        limit: int | None = None,
+        cursor: str | None = None,
+        order_by: str | None = None,
+    ) -> list[T]:
+        return await RetrieveMixin.retrieve(
+            self.model, id=id, offset=offset, limit=limit, cursor=cursor, order_by=order_by, session=self.session
+        )
+
+    def stream(self, chunk_size: int = 1000) -> AsyncIterator[list[sa.engine.RowMapping]]:
+        return RetrieveMixin.stream(self.model, chunk_size=chunk_size, session=self.session)
 
     async def update(self, id: Any, payload: dict[str, Any]):
-        return await UpdateMixin.update(self.model, id, payload)
+        return await UpdateMixin.update(self.model, id, payload, session=self.session)
 
     async def delete(self, id: Any):
-        return await DeleteMixin.delete(self.model, id)
+        return await DeleteMixin.delete(self.model, id, session=self.session)
+
+    async def delete_many(self, ids: Sequence[Any]) -> list[T]:
+        return await DeleteMixin.delete_many(self.model, ids, session=self.session)
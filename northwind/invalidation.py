@@ -0,0 +1,103 @@
+import asyncio
+import json
+import logging
+from typing import Any, Sequence
+
+import asyncpg
+
+from northwind.cache import clear_caches, invalidate_table
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "northwind_cache"
+# postgres rejects NOTIFY payloads of 8000 bytes and more
+MAX_PAYLOAD_SIZE = 7999
+
+# the channel writes are published to, set while a listener is running in this process
+channel: str | None = None
+
+
+def encode_event(table: str, ids: Sequence[Any] | None = None) -> str:
+    payload = json.dumps({"table": table, "ids": list(ids) if ids is not None else None})
+    if len(payload.encode()) > MAX_PAYLOAD_SIZE:
+        # too many ids to name, so the whole table is invalidated
+        payload = json.dumps({"table": table, "ids": None})
+
+    return payload
+
+
+def decode_event(payload: str) -> tuple[str, list | None]:
+    try:
+        event = json.loads(payload)
+        table, ids = event["table"], event["ids"]
+    except (ValueError, TypeError, KeyError):
+        raise ValueError("malformed invalidation event")
+
+    if ids is not None:
+        # composite keys come back from json as lists
+        ids = [tuple(id) if isinstance(id, list) else id for id in ids]
+
+    return table, ids
+
+
+class InvalidationListener:
+    def __init__(self, dsn: str, channel: str = CHANNEL, reconnect_interval: float = 1.0):
+        self.dsn = dsn
+        self.channel = channel
+        self.reconnect_interval = reconnect_interval
+        self._connection: asyncpg.Connection | None = None
+        self._reconnecting: asyncio.Task | None = None
+        self._closing = False
+
+    async def start(self):
+        global channel
+
+        self._closing = False
+        await self._connect()
+        channel = self.channel
+
+    async def stop(self):
+        global channel
+
+        channel = None
+        self._closing = True
+
+        if self._reconnecting is not None:
+            self._reconnecting.cancel()
+
+        if self._connection is not None and not self._connection.is_closed():
+            await self._connection.close()
+
+    async def _connect(self):
+        # a dedicated connection: a pooled one would stop listening as soon as it's checked in
+        self._connection = await asyncpg.connect(self.dsn)
+        self._connection.add_termination_listener(self._on_termination)
+        await self._connection.add_listener(self.channel, self._on_notification)
+
+    async def _reconnect(self):
+        while not self._closing:
+            try:
+                await self._connect()
+            except (OSError, asyncpg.PostgresError):
+                logger.warning("can't reconnect to listen on '%s', retrying", self.channel)
+                await asyncio.sleep(self.reconnect_interval)
+            else:
+                clear_caches()
+                return
+
+    def _on_notification(self, connection: asyncpg.Connection, pid: int, channel: str, payload: str):
+        try:
+            table, ids = decode_event(payload)
+        except ValueError:
+            logger.warning("ignoring malformed invalidation event: %r", payload)
+            return
+
+        invalidate_table(table, ids)
+
+    def _on_termination(self, connection: asyncpg.Connection):
+        if self._closing:
+            return
+
+        # events sent while disconnected are lost, so nothing cached can be trusted anymore
+        clear_caches()
+        self._reconnecting = asyncio.get_running_loop().create_task(self._reconnect())
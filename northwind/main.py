@@ -1,14 +1,34 @@
 from fastapi import APIRouter, FastAPI
 
 from northwind.api.regions import router as regions
+from northwind.api.responses import ORJSONResponse
+from northwind.config import Settings, get_settings
+from northwind.database import dispose_engine, init_engine
+from northwind.invalidation import InvalidationListener
 
 # TODO: add CORSMiddleware
-# TODO: add pydantic Setting
 # TODO: middleware to check if user is admin
 
 
-def create_app() -> FastAPI:
-    app = FastAPI()
+def create_app(settings: Settings | None = None) -> FastAPI:
+    settings = settings if settings else get_settings()
+
+    listener = None
+    if settings.cache_invalidation_channel:
+        listener = InvalidationListener(settings.dsn, settings.cache_invalidation_channel)
+
+    async def startup():
+        init_engine(settings)
+        if listener:
+            await listener.start()
+
+    async def shutdown():
+        if listener:
+            await listener.stop()
+        await dispose_engine()
+
+    app = FastAPI(default_response_class=ORJSONResponse, on_startup=[startup], on_shutdown=[shutdown])
+    app.dependency_overrides[get_settings] = lambda: settings
 
     router = APIRouter(prefix="/api")
     router.include_router(regions)
@@ -12,3 +12,4 @@ class Region(Base):
 
 class RegionService(CRUDService):
     default_model = Region
+    cache_ttl = 60
@@ -4,6 +4,10 @@ from typing import Type, TypeVar
 T = TypeVar("T")
 
 
+def get_database_url(user: str, password: str, host: str, port: str, dbname: str, dialect: str = "postgres") -> str:
+    return f"{dialect}://{user}:{password}@{host}:{port}/{dbname}"
+
+
 def make_object_factory(c: Type[T], *defaults, **kwdefaults):
     def factory(*args, batch: int | None = None, **kwargs) -> T:
         # TODO: implement overriding defaults values
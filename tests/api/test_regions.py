@@ -13,6 +13,8 @@ from httpx import AsyncClient
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from northwind.cache import get_cache
+from northwind.config import Settings, get_settings
 from northwind.database import place_records_into_session_and_commit
 from northwind.models import Region
 from northwind.utils import make_api_url, make_object_factory
@@ -141,6 +143,39 @@ async def test_api_get_list_of_regions_with_incorrect_query_params_responses_422
         assert d["type"] == e["type"]
 
 
+@pytest.mark.parametrize(["limit", "regions_count"], [(1, 3), (2, 3), (3, 3), (2, 4)])
+async def test_api_get_list_of_regions_using_cursor_pagination(
+    limit: int,
+    regions_count: int,
+    client: AsyncClient,
+    session: AsyncSession,
+):
+    regions = [region_factory() for _ in range(regions_count)]
+    await place_records_into_session_and_commit(regions, session)
+
+    seen = []
+    cursor = None
+    while True:
+        response = await client.get(api_region_url_factory(limit=limit, cursor=cursor))
+        assert response.status_code == 200
+
+        page = response.json()
+        assert len(page) <= limit
+        seen += [region["region_id"] for region in page]
+
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert seen == sorted(region.region_id for region in regions)
+
+
+@pytest.mark.parametrize(["cursor"], [("not-a-cursor",), ("WzEsIDJd",)])
+async def test_api_get_list_of_regions_with_malformed_cursor_responses_422(cursor: str, client: AsyncClient):
+    response = await client.get(api_region_url_factory(limit=1, cursor=cursor))
+    assert response.status_code == 422
+
+
 async def test_api_get_region_by_id(client: AsyncClient, session: AsyncSession):
     region: Region = region_factory()
     await place_records_into_session_and_commit([region], session)
@@ -155,6 +190,80 @@ async def test_api_get_region_by_id(client: AsyncClient, session: AsyncSession):
     assert response_region["region_description"] == TEST_DESCRIPTION
 
 
+@pytest.mark.parametrize(["detail"], [(True,), (False,)])
+async def test_api_get_regions_responses_304_if_etag_matches(detail: bool, client: AsyncClient, session: AsyncSession):
+    region: Region = region_factory()
+    await place_records_into_session_and_commit([region], session)
+
+    url = api_region_url_factory(region.region_id) if detail else api_region_url_factory()
+
+    response = await client.get(url)
+    etag = response.headers["ETag"]
+
+    response = await client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+
+    await client.put(api_region_url_factory(region.region_id), content=json.dumps({"region_description": "Updated"}))
+
+    response = await client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+async def test_api_trusted_and_validated_serialization_give_the_same_responses(
+    application, client: AsyncClient, session: AsyncSession
+):
+    regions = [region_factory() for _ in range(3)]
+    await place_records_into_session_and_commit(regions, session)
+
+    responses = {}
+    for trusted in (True, False):
+        application.dependency_overrides[get_settings] = lambda: Settings(trusted_serialization=trusted)
+        responses[trusted] = [
+            await client.get(api_region_url_factory(limit=2)),
+            await client.get(api_region_url_factory(regions[0].region_id)),
+        ]
+
+    for trusted, validated in zip(responses[True], responses[False]):
+        assert trusted.status_code == validated.status_code == 200
+        assert trusted.json() == validated.json()
+        assert trusted.headers["ETag"] == validated.headers["ETag"]
+        assert trusted.headers.get("X-Next-Cursor") == validated.headers.get("X-Next-Cursor")
+
+
+@pytest.mark.parametrize(["regions_count", "chunk_size"], [(0, None), (3, None), (3, 2), (5, 1)])
+async def test_api_export_regions_as_ndjson(
+    regions_count: int, chunk_size: int | None, client: AsyncClient, session: AsyncSession
+):
+    regions = [region_factory() for _ in range(regions_count)]
+    await place_records_into_session_and_commit(regions, session)
+
+    response = await client.get(api_region_url_factory("export", chunk_size=chunk_size))
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == [{"region_id": r.region_id, "region_description": r.region_description} for r in regions]
+
+
+@pytest.mark.parametrize(["regions_count", "chunk_size"], [(0, None), (3, 2)])
+async def test_api_export_regions_as_csv(
+    regions_count: int, chunk_size: int | None, client: AsyncClient, session: AsyncSession
+):
+    regions = [region_factory() for _ in range(regions_count)]
+    await place_records_into_session_and_commit(regions, session)
+
+    response = await client.get(api_region_url_factory("export", format="csv", chunk_size=chunk_size))
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+
+    lines = response.text.splitlines()
+    assert lines[0] == "region_id,region_description"
+    assert lines[1:] == [f"{r.region_id},{r.region_description}" for r in regions]
+
+
 async def test_api_get_region_by_id_raises_error_if_no_rows_found(client: AsyncClient):
     with pytest.raises(NoResultFound):
         await client.get("/api/regions/99999/")
@@ -240,6 +349,28 @@ async def test_api_create_new_region(
     assert region["region_description"] == TEST_DESCRIPTION
 
 
+@pytest.mark.parametrize(["regions_count", "copy_threshold"], [(1, 5000), (3, 5000), (3, 1)])
+async def test_api_create_batch_of_regions(
+    regions_count: int,
+    copy_threshold: int,
+    client: AsyncClient,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr("northwind.database.COPY_THRESHOLD", copy_threshold)
+    payload = [{"region_description": f"{TEST_DESCRIPTION} {i}"} for i in range(regions_count)]
+
+    response = await client.post(api_region_url_factory("batch"), content=json.dumps(payload))
+    assert response.status_code == 201
+
+    regions = response.json()
+    assert [region["region_id"] for region in regions] == list(range(1, regions_count + 1))
+    assert [region["region_description"] for region in regions] == [p["region_description"] for p in payload]
+
+    # generated keys must stay in sync with the sequence, whichever way the rows were loaded
+    response = await client.post(api_region_url_factory(), content=json.dumps(payload[0]))
+    assert response.json()["region_id"] == regions_count + 1
+
+
 @pytest.mark.parametrize(
     ["payload"],
     [
@@ -266,6 +397,37 @@ async def test_api_update_description_of_existing_region(
     assert response_region["region_description"] == "Updated"
 
 
+async def test_api_update_persists_changes(client: AsyncClient, session: AsyncSession):
+    region: Region = region_factory()
+    await place_records_into_session_and_commit([region], session)
+
+    url = api_region_url_factory(region.region_id)
+
+    response = await client.put(url, content=json.dumps({"region_description": "Updated"}))
+    assert response.status_code == 200
+
+    response = await client.get(url)
+    assert response.json()["region_description"] == "Updated"
+
+
+async def test_api_cached_region_is_invalidated_by_update(client: AsyncClient, session: AsyncSession):
+    region: Region = region_factory()
+    await place_records_into_session_and_commit([region], session)
+
+    url = api_region_url_factory(region.region_id)
+    cache = get_cache(Region)
+    hits = cache.hits
+
+    await client.get(url)
+    await client.get(url)
+    assert cache.hits == hits + 1
+
+    await client.put(url, content=json.dumps({"region_description": "Updated"}))
+
+    response = await client.get(url)
+    assert response.json()["region_description"] == "Updated"
+
+
 async def test_api_update_but_no_item_found_raised(client: AsyncClient):
     with pytest.raises(NoResultFound):
         await client.put("/api/regions/99999/", content=json.dumps({"region_description": "Updated"}))
@@ -282,3 +444,8 @@ async def test_api_delete_region_by_id(client: AsyncClient, session: AsyncSessio
 
     response_region = response.json()
     assert response_region["region_id"] == region.region_id
+
+
+async def test_api_delete_region_responses_404_if_no_rows_found(client: AsyncClient):
+    response = await client.delete("/api/regions/99999/")
+    assert response.status_code == 404
@@ -1,5 +1,4 @@
 import asyncio
-import os
 
 import pytest
 import pytest_asyncio
@@ -7,7 +6,9 @@ from httpx import AsyncClient
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm.session import sessionmaker
 
-from northwind.database import Base, get_database_url
+from northwind.cache import clear_caches
+from northwind.config import get_settings
+from northwind.database import Base
 from northwind.main import create_app
 
 
@@ -21,15 +22,7 @@ def event_loop(request):
 
 @pytest_asyncio.fixture(scope="module")
 async def engine():
-    # FIXME: remove code duplication
-    user = "postgres"
-    passw = "postgres"
-    host = "localhost"
-    port = e if (e := os.getenv("POSTGRES_PORT")) else 5432
-    db = e if (e := os.getenv("POSTGRES_DB")) else "northwind"
-
-    database_test_uri = get_database_url(user, passw, host, port, db, dialect="postgresql+asyncpg")
-    _engine = create_async_engine(database_test_uri, echo=False)
+    _engine = create_async_engine(get_settings().database_url, echo=False)
     yield _engine
 
 
@@ -44,6 +37,7 @@ async def session(engine):
 @pytest_asyncio.fixture
 async def setup_teardown_database(engine):
     async def setup():
+        clear_caches()
         async with engine.begin() as connection:
             await connection.run_sync(Base.metadata.drop_all)
             await connection.run_sync(Base.metadata.create_all)
@@ -23,4 +23,4 @@ async def test_create_region_using_own_CRUDService(_create):
 
     await service.create(payload)
 
-    _create.assert_called_once_with(Region, payload)
+    _create.assert_called_once_with(Region, payload, session=None)
@@ -0,0 +1,61 @@
+from unittest import mock
+
+import pytest
+
+from northwind.cache import MISSING, LRUCache
+
+
+def test_lru_cache_get_and_set():
+    cache = LRUCache(maxsize=2)
+
+    assert cache.get("a") is MISSING
+    cache.set("a", None)
+    assert cache.get("a") is None
+
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert len(cache) == 2
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+@mock.patch("northwind.cache.time.monotonic")
+def test_lru_cache_expires_items(monotonic):
+    cache = LRUCache(ttl=10)
+
+    monotonic.return_value = 100
+    cache.set("a", 1)
+
+    monotonic.return_value = 109
+    assert cache.get("a") == 1
+
+    monotonic.return_value = 110
+    assert cache.get("a") is MISSING
+    assert len(cache) == 0
+
+
+def test_lru_cache_evict_where():
+    cache = LRUCache()
+    cache.set(("id", 1), 1)
+    cache.set(("list", None, None), [1])
+
+    cache.evict_where(lambda key: key[0] == "list")
+
+    assert cache.get(("id", 1)) == 1
+    assert cache.get(("list", None, None)) is MISSING
+
+
+@pytest.mark.parametrize(["maxsize"], [(0,), (-1,)])
+def test_lru_cache_with_incorrect_maxsize_raises_value_error(maxsize: int):
+    with pytest.raises(ValueError):
+        LRUCache(maxsize=maxsize)
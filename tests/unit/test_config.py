@@ -0,0 +1,14 @@
+import pytest
+
+from northwind.config import Settings
+
+
+def test_settings_database_url():
+    settings = Settings(postgres_user="user", postgres_password="pw", postgres_host="db", postgres_port=6543)
+    assert settings.database_url == f"postgresql+asyncpg://user:pw@db:6543/{settings.postgres_db}"
+
+
+@pytest.mark.parametrize(["variable", "field", "value", "expected"], [("POOL_SIZE", "pool_size", "20", 20)])
+def test_settings_read_from_environment(variable, field, value, expected, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv(variable, value)
+    assert getattr(Settings(), field) == expected
@@ -7,7 +7,25 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm.session import sessionmaker
 
-from northwind.database import get_database_url, get_session, place_records_into_session_and_commit, primary_key
+from northwind.config import Settings
+from northwind.database import (
+    CreateMixin,
+    DeleteMixin,
+    RetrieveMixin,
+    create_engine,
+    decode_cursor,
+    dispose_engine,
+    encode_cursor,
+    get_database_url,
+    get_request_session,
+    get_router,
+    get_session,
+    get_sessionmaker,
+    init_engine,
+    next_cursor,
+    place_records_into_session_and_commit,
+    primary_key,
+)
 
 Base = declarative_base()
 
@@ -36,6 +54,17 @@ def test_get_database_url(user, pw, host, port, dbname, dialect):
     assert url == f"{dialect}://{user}:{pw}@{host}:{port}/{dbname}"
 
 
+@pytest.mark.asyncio
+async def test_create_engine_applies_settings():
+    engine = create_engine(Settings(pool_size=3, max_overflow=1, statement_timeout=1500))
+    assert engine.pool.size() == 3
+
+    async with engine.connect() as connection:
+        assert (await connection.execute(sa.text("SHOW statement_timeout"))).scalar() == "1500ms"
+
+    await engine.dispose()
+
+
 @pytest.mark.asyncio
 async def test_get_session(engine):
     sm = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
@@ -102,3 +131,133 @@ async def test_place_records_into_session_and_commit(value: bool, engine, sessio
 
     async with engine.begin() as connection:
         await connection.run_sync(Base.metadata.drop_all)
+
+
+@pytest.mark.parametrize(["values"], [([1],), ([1, 2],), (["a", None],)])
+def test_encode_and_decode_cursor(values: list):
+    assert decode_cursor(encode_cursor(values)) == values
+
+
+@pytest.mark.parametrize(["cursor"], [("!!!",), ("e30=",)])
+def test_decode_malformed_cursor_raises_value_error(cursor: str):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_next_cursor_points_to_the_last_record():
+    records = [ModelWithTwoPK(id1_field=1, id2_field=2), ModelWithTwoPK(id1_field=3, id2_field=4)]
+
+    assert decode_cursor(next_cursor(ModelWithTwoPK, records)) == [3, 4]
+    assert next_cursor(ModelWithTwoPK, []) is None
+
+
+@pytest.mark.parametrize(
+    ["model", "records", "ids", "expected_ids"],
+    [
+        (ModelWithOnePK, [ModelWithOnePK(), ModelWithOnePK(), ModelWithOnePK()], [1, 3, 99], [1, 3]),
+        (
+            ModelWithTwoPK,
+            [ModelWithTwoPK(id1_field=1, id2_field=1), ModelWithTwoPK(id1_field=1, id2_field=2)],
+            [(1, 2), (2, 1)],
+            [(1, 2)],
+        ),
+        (ModelWithOnePK, [ModelWithOnePK()], [], []),
+    ],
+)
+@pytest.mark.asyncio
+async def test_delete_many(model, records: list, ids: list, expected_ids: list, engine, session: AsyncSession):
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+
+    await place_records_into_session_and_commit(records, session)
+
+    deleted = await DeleteMixin.delete_many(model, ids)
+    pks = list(primary_key(model))
+    deleted_ids = [
+        getattr(r, pks[0].key) if len(pks) == 1 else tuple(getattr(r, pk.key) for pk in pks) for r in deleted
+    ]
+    assert sorted(deleted_ids) == expected_ids
+
+    async with engine.begin() as connection:
+        left = (await connection.execute(sa.select(sa.func.count()).select_from(model.__table__))).scalar()
+        await connection.run_sync(Base.metadata.drop_all)
+
+    assert left == len(records) - len(expected_ids)
+
+
+@pytest.mark.parametrize(["fails", "expected_count"], [(False, 2), (True, 0)])
+@pytest.mark.asyncio
+async def test_get_request_session_shares_one_transaction(fails: bool, expected_count: int, engine):
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+
+    dependency = get_request_session()
+    session = await dependency.__anext__()
+
+    await CreateMixin.create(ModelWithOnePK, {"boolean_field": True}, session=session)
+    await CreateMixin.create(ModelWithOnePK, {"boolean_field": False}, session=session)
+
+    if fails:
+        with pytest.raises(RuntimeError):
+            await dependency.athrow(RuntimeError())
+    else:
+        with pytest.raises(StopAsyncIteration):
+            await dependency.__anext__()
+
+    async with engine.begin() as connection:
+        count = (await connection.execute(sa.select(sa.func.count()).select_from(ModelWithOnePK.__table__))).scalar()
+        await connection.run_sync(Base.metadata.drop_all)
+
+    assert count == expected_count
+
+
+@pytest_asyncio.fixture
+async def replicated():
+    # a single instance stands in for the primary and both replicas
+    settings = Settings(postgres_replicas=["localhost", f"localhost:{Settings().postgres_port}"])
+    await dispose_engine()
+    init_engine(settings)
+    yield get_router()
+    await dispose_engine()
+
+
+@pytest.mark.asyncio
+async def test_routing_session_sends_reads_to_replicas_and_writes_to_primary(replicated):
+    async with get_sessionmaker()() as session:
+        bind = session.sync_session.get_bind
+        read = sa.select(ModelWithOnePK)
+
+        replicas = [replica.sync_engine for replica in replicated.replicas]
+        assert [bind(clause=read), bind(clause=read)] == replicas
+        assert bind(clause=read.with_for_update()) is replicated.primary.sync_engine
+
+        write = sa.select(ModelWithOnePK).from_statement(sa.delete(ModelWithOnePK).returning(ModelWithOnePK.id_field))
+        assert bind(clause=write) is replicated.primary.sync_engine
+        # read your writes: the session sticks to the primary after a write
+        assert bind(clause=read) is replicated.primary.sync_engine
+
+
+@pytest.mark.asyncio
+async def test_engine_router_least_in_flight_policy(replicated):
+    replicated.policy = "least_in_flight"
+    busy, idle = replicated.replicas
+
+    async with busy.connect() as connection:
+        await connection.execute(sa.text("SELECT 1"))
+        assert replicated.reader() is idle
+
+
+@pytest.mark.asyncio
+async def test_crud_through_replicas(replicated, engine):
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+
+    record = await CreateMixin.create(ModelWithOnePK, {"boolean_field": True})
+    (found,) = await RetrieveMixin.retrieve(ModelWithOnePK, limit=1)
+    assert found.id_field == record.id_field
+
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
@@ -0,0 +1,28 @@
+import pytest
+
+from northwind.api.etag import compute_etag, etag_matches
+from northwind.models.region import Region
+
+
+def test_compute_etag_depends_on_row_values():
+    etag = compute_etag(Region(region_id=1, region_description="a"))
+
+    assert etag == compute_etag([Region(region_id=1, region_description="a")])
+    assert etag != compute_etag(Region(region_id=1, region_description="b"))
+    assert etag.startswith('"') and etag.endswith('"')
+
+
+@pytest.mark.parametrize(
+    ["if_none_match", "expected"],
+    [
+        (None, False),
+        ("", False),
+        ("*", True),
+        ('"abc"', True),
+        ('W/"abc"', True),
+        ('"xyz", "abc"', True),
+        ('"xyz"', False),
+    ],
+)
+def test_etag_matches(if_none_match: str | None, expected: bool):
+    assert etag_matches('"abc"', if_none_match) is expected
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+import sqlalchemy as sa
+
+from northwind import invalidation
+from northwind.cache import MISSING, LRUCache, caches
+from northwind.config import get_settings
+from northwind.invalidation import InvalidationListener, decode_event, encode_event
+
+TABLE = "invalidation_test"
+
+
+@pytest.mark.parametrize(
+    ["ids", "expected"],
+    [(None, None), ([], []), ([1, 2], [1, 2]), ([("a", 1)], [("a", 1)])],
+)
+def test_encode_and_decode_event(ids, expected):
+    assert decode_event(encode_event(TABLE, ids)) == (TABLE, expected)
+
+
+def test_encode_event_falls_back_to_the_whole_table_if_too_many_ids():
+    assert decode_event(encode_event(TABLE, list(range(10000)))) == (TABLE, None)
+
+
+@pytest.mark.parametrize(["payload"], [("",), ("[]",), ('{"table": "t"}',)])
+def test_decode_malformed_event_raises_value_error(payload: str):
+    with pytest.raises(ValueError):
+        decode_event(payload)
+
+
+@pytest.mark.asyncio
+async def test_listener_evicts_entries_published_on_commit(engine):
+    cache = caches[TABLE] = LRUCache()
+    cache.set(("id", 1), "one")
+    cache.set(("id", 2), "two")
+
+    listener = InvalidationListener(get_settings().dsn, channel=TABLE)
+    await listener.start()
+    assert invalidation.channel == TABLE
+
+    try:
+        async with engine.begin() as connection:
+            await connection.execute(sa.select(sa.func.pg_notify(TABLE, encode_event(TABLE, [1]))))
+
+        for _ in range(100):
+            if len(cache) == 1:
+                break
+            await asyncio.sleep(0.01)
+
+        assert cache.get(("id", 1)) is MISSING
+        assert cache.get(("id", 2)) == "two"
+    finally:
+        await listener.stop()
+        del caches[TABLE]
+
+    assert invalidation.channel is None